@@ -2,16 +2,46 @@ import json
 import yaml
 import re
 import os
+import hashlib
+import mmap
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
+_DOCS_RE_B = re.compile(rb"{% docs (.*?) %}(.*?){% enddocs %}", re.DOTALL)
+_DOCS_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "dbterd"
+# Bump when the markdown parsing rules change so cached docs are parsed again
+_DOCS_CACHE_VERSION = 2
+_COL_TMPL = "{} {} {}\n".format
+# Matches either a jinja doc() block or a single quote, so descriptions are cleaned in one pass
+_DESC_RE = re.compile(r'\'?{{\s*doc\(\s*\"(\w+)\"\s*\)\s*}}\'?\n?|\'')
+
 class DbmlDocs:
-    def __init__(self, schema_path, catalog_path, docs_path, dbml_path):
+    def __init__(self, schema_path, catalog_path, docs_path, dbml_path, stream_catalog=False):
         """
         This class creates a DBML (Database Markup Language) file from other files typically found in a dbt project.
 
         Attributes:
             schema (dict): The loaded dbt YAML file used to parse column names, tests, and descriptions.
-            catalog (dict): The loaded dbt catalog.json file used to parse table names.
+            catalog (dict): The loaded dbt catalog.json file used to parse table names, None when it is streamed.
+            catalog_path (str or Path): Path to the dbt catalog.json file, streamed when generating the DBML.
+            stream_catalog (bool): Whether the catalog is streamed with ijson instead of loaded at once.
             docs_dict (dict): A dictionary created from parsed markdown files in the docs_path.
             dbml_path (str): The path to the output DBML file.
         
@@ -20,13 +50,26 @@ class DbmlDocs:
             catalog_path (str or Path): Path to the dbt catalog.json file.
             docs_path (str or Path): Path to the directory containing docs markdown files.
             dbml_path (str or Path): Path to the output DBML file.
+            stream_catalog (bool): Stream the catalog nodes with ijson so the whole catalog is never held in memory.
+                Requires ijson. Otherwise the catalog is loaded at once with orjson, or json if orjson is not installed.
         """
-        
+        if stream_catalog and ijson is None:
+            raise ImportError("Streaming the catalog requires ijson, install dbterd with the 'stream' extra")
+
         self.schema = self.LoadSchema(schema_path)
-        self.catalog = self.LoadCatalog(catalog_path)
+        self.catalog_path = catalog_path
+        self.stream_catalog = stream_catalog
+        self.catalog = None if stream_catalog else self.LoadCatalog(catalog_path)
         self.docs_dict = self.ParseDocsMarkdownFiles(docs_path)
         self.dbml_path = dbml_path
 
+        # Lookups from lower-cased schema model name to model and to its columns by lower-cased name
+        self._models_by_name = {m['name'].lower(): m for m in self.schema['models']}
+        self._cols_by_model = {
+            m['name'].lower(): {c['name'].lower(): c for c in m.get('columns', [])} for m in self.schema['models']
+        }
+        self._relationships = self._FindRelationships()
+
     def LoadSchema(self, schema_path):
         """Loads the dbt schema. The schema selected is the one that will be used to generate the ERD diagram.
 
@@ -38,7 +81,7 @@ class DbmlDocs:
         """    
         try:
             with open(schema_path, 'r') as f:
-                schema = yaml.safe_load(f)
+                schema = yaml.load(f, Loader=_SafeLoader)
         except (FileNotFoundError, yaml.YAMLError) as e:
             print(f"Failed to load schema: {e}")
             return None
@@ -53,54 +96,126 @@ class DbmlDocs:
 
         Returns:
             catalog (dict): Catalog dict 
+
+        Raises:
+            ValueError: If the catalog could not be read or parsed
         """    
         try:
-            with open(catalog_path, 'r') as f:
-                catalog = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Failed to load catalog: {e}")
-            return None
+            with open(catalog_path, 'rb') as f:
+                catalog = _json_loads(f.read())
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Failed to load catalog: {e}") from e
 
         return catalog
-    
-    # def ReplaceJinjaVariables(self, text):
-    #     jinja_variable_pattern = re.compile(r'\'?{{\s*doc\(\s*\"(\w+)\"\s*\)\s*}}\'?\n?')
 
-    #     replace_variable = self.docs_dict.get(match.group(1), match.group(0))
+    def IterCatalogNodes(self):
+        """Yields the nodes of the dbt catalog. Streams them with ijson if stream_catalog is set,
+        otherwise yields them from the catalog loaded in __init__.
 
-    #     return jinja_variable_pattern.sub(replace_variable, text)
-    
-    def ReplaceJinjaVariables(self, text):
-        jinja_variable_pattern = re.compile(r'\'?{{\s*doc\(\s*\"(\w+)\"\s*\)\s*}}\'?\n?')
-        return jinja_variable_pattern.sub(lambda match: self.docs_dict.get(match.group(1), ""), text)
+        Yields:
+            (node_name, node) (tuple): Catalog node name and its JSON object
+
+        Raises:
+            ValueError: If the streamed catalog could not be loaded, also when it breaks off partway
+        """
+        if not self.stream_catalog:
+            yield from self.catalog["nodes"].items()
+            return
+
+        try:
+            with open(self.catalog_path, 'rb') as f:
+                yield from ijson.kvitems(f, 'nodes', use_float=True)
+        except (OSError, ijson.JSONError) as e:
+            raise ValueError(f"Failed to load catalog: {e}") from e
 
-    
     def ParseDocsMarkdownFiles(self, docs_path):
-        # Create a dictionary from the docs.md file
-        docs_dict = {}
+        """Parses the docs markdown files, reusing a cached result if none of the files changed.
 
-        docs_pattern = re.compile(r"{% docs (.*?) %}(.*?){% enddocs %}", re.DOTALL)
+        Args:
+            docs_path (str or Path): Path to the directory containing docs markdown files
 
+        Returns:
+            docs_dict (dict): Doc block names mapped to their content
+        """
         docs_path = Path(docs_path)
 
-        if os.path.exists(docs_path):
-            # Loop through all files in the docs folder
-            for filename in docs_path.iterdir():
-                # Check if the file is a markdown file
-                if filename.suffix == ".md":
-                    try:
-                        # Load the content of the markdown file
-                        with open(filename, "r", encoding="utf-8") as docs_file:
-                            docs_content = docs_file.read()
-
-                        for match in docs_pattern.finditer(docs_content):
-                            key = match.group(1).strip()
-                            value = match.group(2).strip()
-                            docs_dict[key] = value.replace("'", "")
-                    except IOError as e:
-                        print(f"Error reading file {filename}: {e}")
-                    except UnicodeDecodeError as e:
-                        print(f"Error decoding file {filename}: {e}")
+        if not os.path.exists(docs_path):
+            return {}
+
+        # Loop through all files in the docs folder and keep the markdown files
+        with os.scandir(docs_path) as entries:
+            md_files = [entry for entry in entries if entry.name.endswith(".md") and entry.is_file()]
+
+        # One cache file per docs folder, holding the fingerprint of the markdown files it was parsed from
+        docs_folder = str(docs_path.resolve())
+        fingerprint = (_DOCS_CACHE_VERSION, docs_folder, tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in md_files
+        )))
+        cache_path = _DOCS_CACHE_DIR / (hashlib.sha256(docs_folder.encode()).hexdigest() + ".pkl")
+
+        try:
+            with open(cache_path, "rb") as cache_file:
+                cached_fingerprint, cached_docs_dict = pickle.load(cache_file)
+            if cached_fingerprint == fingerprint:
+                return cached_docs_dict
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError):
+            pass
+
+        docs_dict, has_errors = self._ParseDocsMarkdownFiles([entry.path for entry in md_files])
+
+        # Files that failed to parse are retried on the next run instead of being cached as missing
+        if not has_errors:
+            try:
+                _DOCS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                with open(cache_path, "wb") as cache_file:
+                    pickle.dump((fingerprint, docs_dict), cache_file)
+            except OSError as e:
+                print(f"Failed to write docs cache: {e}")
+
+        return docs_dict
+
+    def _ParseDocsMarkdownFiles(self, md_paths):
+        # Create a dictionary from the docs.md files, parsing the files in parallel
+        docs_dict = {}
+        has_errors = False
+
+        if len(md_paths) <= 1:
+            results = map(self._ParseDocsMarkdownFile, md_paths)
+        else:
+            with ThreadPoolExecutor(max_workers=min(8, len(md_paths))) as executor:
+                results = list(executor.map(self._ParseDocsMarkdownFile, md_paths))
+
+        # Merge in file order so later files override earlier ones as before
+        for file_docs in results:
+            if file_docs is None:
+                has_errors = True
+            else:
+                docs_dict.update(file_docs)
+
+        return docs_dict, has_errors
+
+    def _ParseDocsMarkdownFile(self, filename):
+        # Returns None if the file could not be read or decoded, so none of its doc blocks are used
+        docs_dict = {}
+
+        try:
+            # Scan the raw bytes of the markdown file and only decode the doc blocks
+            with open(filename, "rb") as docs_file:
+                if os.fstat(docs_file.fileno()).st_size == 0:
+                    return docs_dict
+                with mmap.mmap(docs_file.fileno(), 0, access=mmap.ACCESS_READ) as docs_content:
+                    for match in _DOCS_RE_B.finditer(docs_content):
+                        # Decode before stripping so unicode whitespace is stripped too, and translate
+                        # newlines the way reading the file in text mode did
+                        key = match.group(1).decode("utf-8").strip()
+                        value = match.group(2).decode("utf-8").strip()
+                        docs_dict[key] = value.replace("\r\n", "\n").replace("\r", "\n").replace("'", "")
+        except IOError as e:
+            print(f"Error reading file {filename}: {e}")
+            return None
+        except UnicodeDecodeError as e:
+            print(f"Error decoding file {filename}: {e}")
+            return None
 
         return docs_dict
     
@@ -109,48 +224,48 @@ class DbmlDocs:
             return ""
             
         description = entity["description"]
+        # Most descriptions have no doc() blocks, so skip the regex for those
         if "{{" in description:
-            return "Note: '" + self.ReplaceJinjaVariables(description) + "'"
+            description = _DESC_RE.sub(self._ReplaceDescriptionMatch, description)
         else:
-            return "Note: '" + description.replace("'","") + "'"
+            description = description.replace("'", "")
+        return "Note: '" + description + "'"
+
+    def _ReplaceDescriptionMatch(self, match):
+        # A bare quote has no doc name and is dropped, doc() blocks are replaced by their docs
+        if match.group(1) is None:
+            return ""
+        return self.docs_dict.get(match.group(1), "")
 
-    def WriteTable(self, dbml_file, model):
+    def WriteTable(self, dbml_parts, model):
         """Create a table in the dbml file. 
 
         Args:
+            dbml_parts (list): Buffer of dbml strings the table is appended to
             model: JSON object from catalog representing the dbt model
-            docs_path: Path to docs folder containing docs.md files
         """    
         name = model["metadata"]["name"]
-        columns = list(model["columns"].keys())
         start = "{"
         end = "}"
 
         # Find the model in the schema YAML file
-        schema_model = None
-        for m in self.schema['models']:
-            if m['name'] == name.lower():
-                schema_model = m
-                break
-        
+        model_key = name.lower()
+        schema_model = self._models_by_name.get(model_key)
+        schema_columns = self._cols_by_model[model_key]
+
         model_description = self.ParseDescription(schema_model)
 
-        dbml_file.write(f"Table {name} {start}\n")
+        dbml_parts.append(f"Table {name} {start}\n")
 
-        for column_name in columns:
-            column = model["columns"][column_name] 
+        for column in model["columns"].values():
             name = column["name"]
             dtype = column["type"]
 
             # Set default values
-            schema_column = None
             column_tests_and_description = ""
-            
+
             # Find the column in the schema_model
-            for c in schema_model["columns"]:
-                if c["name"] == name.lower():
-                    schema_column = c
-                    break
+            schema_column = schema_columns.get(name.lower())
 
             if schema_column != None:
                 column_docs_list = []
@@ -169,42 +284,63 @@ class DbmlDocs:
                 if column_docs_list:
                     column_tests_and_description = '[' + ', '.join(column_docs_list) + ']'
                 
-            dbml_file.write(f"{name} {dtype} {column_tests_and_description}\n")
-        dbml_file.write(f"{model_description}\n{end}\n")
+            dbml_parts.append(_COL_TMPL(name, dtype, column_tests_and_description))
+        dbml_parts.append(f"{model_description}\n{end}\n")
         
 
-    def WriteRelationship(self, dbml_file):
+    def WriteRelationship(self, dbml_parts):
         """Create a relationship in the dbml file. Loops over all columns to find relationship tests and saves them to the dbml file
+
+        Args:
+            dbml_parts (list): Buffer of dbml strings the relationships are appended to
+
+        Raises:
+            ValueError: If a relationship 'to' value is not in the ref('model') format
         """    
+        for r2, r2_field, relationship in self._relationships:
+            r1 = relationship["to"].upper()
+            # Take the model name out of ref('model')
+            start = r1.find("'") + 1
+            end = r1.find("'", start) if start else -1
+            if end == -1:
+                raise ValueError(
+                    f"Relationship test on {r2}.{r2_field} has to: {relationship['to']!r}, expected ref('model')"
+                )
+            r1 = r1[start:end]
+            r1_field = relationship["field"].upper()
+            dbml_parts.append(f"Ref: {r1}.{r1_field} > {r2}.{r2_field}\n")
+
+    def _FindRelationships(self):
+        """Collect all relationship tests in the schema.
+
+        Returns:
+            relationships (list): (model name, column name, relationship) tuples for every relationship test,
+                with the names upper-cased
+        """
+        relationships = []
         for model in self.schema["models"]:
-            for column in model["columns"]:
-                if "tests" in column:
-                    tests = column["tests"]
-                    for test in tests:
-                        if isinstance(test, dict): 
-                            if "relationships" in test:
-                                relationship = test["relationships"]
-                                # errors here if relationship test is not in the right format in the dbt yml
-                                r1 = relationship["to"].upper()
-                                r1 = re.findall(r"('.*?')", r1, re.DOTALL)[0].replace("'", "")
-                                r1_field = relationship["field"].upper()
-                                
-                                r2 = model["name"].upper()
-                                r2_field = column["name"].upper()
-                                dbml_file.write(f"Ref: {r1}.{r1_field} > {r2}.{r2_field}\n")
-                                
+            model_name_upper = model["name"].upper()
+            for column in model.get("columns", []):
+                col_name_upper = column["name"].upper()
+                for test in column.get("tests", []):
+                    if isinstance(test, dict) and "relationships" in test:
+                        relationships.append((model_name_upper, col_name_upper, test["relationships"]))
+
+        return relationships
 
     def GenerateDbml(self):
-        """Create dbml file
+        """Create dbml file. Nothing is written if the catalog fails to load.
         """
         
-        model_names = self.catalog["nodes"]
-        tables = [model["name"].upper() for model in self.schema["models"]]
+        tables = {model["name"].upper() for model in self.schema["models"]}
         
+        # Build the whole dbml in memory and write it in one go
+        dbml_parts = []
+        for _, model in self.IterCatalogNodes():
+            if model["metadata"]["name"] in tables: 
+                self.WriteTable(dbml_parts, model)
+        self.WriteRelationship(dbml_parts)
+
         with open(self.dbml_path, "w") as dbml_file:
-            for model_name in model_names:
-                model = self.catalog["nodes"][model_name]
-                if model["metadata"]["name"] in tables: 
-                    self.WriteTable(dbml_file, model)
-            self.WriteRelationship(dbml_file)
+            dbml_file.write("".join(dbml_parts))
 
@@ -1,6 +1,30 @@
 import click
 from .core import DbmlDocs
 import subprocess
+import os
+
+
+def _newest_mtime(path, suffix):
+    """Returns the newest modification time of the files ending with suffix under path, searched recursively."""
+    newest = 0.0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                newest = max(newest, _newest_mtime(entry.path, suffix))
+            elif entry.name.endswith(suffix):
+                newest = max(newest, entry.stat().st_mtime)
+    return newest
+
+
+def _catalog_is_fresh(catalog_path, models_path="models"):
+    """Checks if the dbt catalog is newer than every .sql model in the dbt project.
+    Anything that cannot be checked counts as stale, so the docs are generated again."""
+    try:
+        if not os.path.exists(catalog_path) or not os.path.isdir(models_path):
+            return False
+        return os.path.getmtime(catalog_path) > _newest_mtime(models_path, ".sql")
+    except OSError:
+        return False
 
 
 @click.command()
@@ -10,13 +34,22 @@ import subprocess
 @click.argument('docs_path', type=str)
 @click.argument('project_name', type=str)
 @click.argument('visualize', type=bool)
-def cli(schema_path, catalog_path, dbml_path, docs_path, project_name, visualize):
+@click.option('--stream-catalog', is_flag=True, help="Stream catalog.json with ijson instead of loading it at once.")
+@click.option('--models-path', type=str, default="models", show_default=True,
+              help="Folder with the dbt models, used to check if catalog.json is up to date.")
+@click.option('--force', is_flag=True, help="Always run dbt docs generate, even if catalog.json is up to date.")
+def cli(schema_path, catalog_path, dbml_path, docs_path, project_name, visualize, stream_catalog, models_path, force):
     """"Generate a DBML file from a dbt project and visualize it with dbdocs.io"""
     
-    subprocess.run(f"dbt docs generate", text=True, shell=True)
+    # Generating the docs is slow, so only do it if a model changed since the catalog was built
+    if force or not _catalog_is_fresh(catalog_path, models_path):
+        subprocess.run(f"dbt docs generate", text=True, shell=True)
 
-    dbml_docs = DbmlDocs(schema_path, catalog_path, docs_path, dbml_path)
-    dbml_docs.GenerateDbml()
+    try:
+        dbml_docs = DbmlDocs(schema_path, catalog_path, docs_path, dbml_path, stream_catalog=stream_catalog)
+        dbml_docs.GenerateDbml()
+    except (ImportError, ValueError) as e:
+        raise click.ClickException(str(e))
 
     if visualize == "launch-dbdocs":
         subprocess.run(f"dbdocs build {dbml_path} --project {project_name}", text=True, shell=True)
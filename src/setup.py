@@ -10,7 +10,11 @@ setup(
     license='MIT',
     packages=find_packages(),
     include_package_data=True,
+    # pyyaml uses the LibYAML C parser when libyaml is available at build time,
+    # which is much faster for large schema files.
     install_requires=['pyyaml', 'Click'],
+    # orjson speeds up loading large catalog.json files, ijson streams them instead
+    extras_require={'fast': ['orjson'], 'stream': ['ijson']},
     
     entry_points='''
         [console_scripts]
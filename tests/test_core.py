@@ -0,0 +1,151 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from dbterd import core
+from dbterd.core import DbmlDocs
+
+TESTS_DIR = Path(__file__).parent
+
+
+def make_dbml_docs(tmp_path, catalog_path=TESTS_DIR / "catalog.json", stream_catalog=False):
+    return DbmlDocs(TESTS_DIR / "schema.yml", catalog_path, tmp_path / "no_docs", tmp_path / "test.dbml", stream_catalog)
+
+
+@pytest.mark.parametrize("stream_catalog", [False, True])
+@pytest.mark.parametrize("catalog_name", ["missing.json", "catalog_dir"])
+def test_catalog_load_error(tmp_path, capsys, stream_catalog, catalog_name):
+    if stream_catalog:
+        pytest.importorskip("ijson")
+    (tmp_path / "catalog_dir").mkdir()
+    with pytest.raises(ValueError, match="^Failed to load catalog: "):
+        make_dbml_docs(tmp_path, tmp_path / catalog_name, stream_catalog).GenerateDbml()
+    assert not (tmp_path / "test.dbml").exists()
+    assert capsys.readouterr().out == ""
+
+
+def test_catalog_loaded_eagerly(tmp_path):
+    assert "model.jaffle_shop.customers" in make_dbml_docs(tmp_path).catalog["nodes"]
+
+
+def test_truncated_catalog_stream(tmp_path):
+    pytest.importorskip("ijson")
+    catalog = (TESTS_DIR / "catalog.json").read_bytes()
+    catalog_path = tmp_path / "catalog.json"
+    catalog_path.write_bytes(catalog[:len(catalog) * 3 // 4])
+
+    dbml_docs = make_dbml_docs(tmp_path, catalog_path, stream_catalog=True)
+    with pytest.raises(ValueError):
+        dbml_docs.GenerateDbml()
+    assert not (tmp_path / "test.dbml").exists()
+
+
+def test_stream_catalog_matches_load(tmp_path):
+    pytest.importorskip("ijson")
+    make_dbml_docs(tmp_path).GenerateDbml()
+    loaded = (tmp_path / "test.dbml").read_text()
+    make_dbml_docs(tmp_path, stream_catalog=True).GenerateDbml()
+    assert (tmp_path / "test.dbml").read_text() == loaded
+
+
+def test_docs_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "_DOCS_CACHE_DIR", tmp_path / "cache")
+    docs_path = tmp_path / "docs"
+    docs_path.mkdir()
+    docs_file = docs_path / "docs.md"
+    docs_file.write_text("{% docs orders_status %}\nStatus of the order\n{% enddocs %}\n")
+
+    dbml_docs = make_dbml_docs(tmp_path)
+    parsed = []
+    parse = dbml_docs._ParseDocsMarkdownFiles
+
+    def counting_parse(md_paths):
+        parsed.append(md_paths)
+        return parse(md_paths)
+
+    monkeypatch.setattr(dbml_docs, "_ParseDocsMarkdownFiles", counting_parse)
+
+    assert dbml_docs.ParseDocsMarkdownFiles(docs_path) == {"orders_status": "Status of the order"}
+    assert dbml_docs.ParseDocsMarkdownFiles(docs_path) == {"orders_status": "Status of the order"}
+    assert len(parsed) == 1
+
+    # Touching a file invalidates the cache and overwrites the same cache file
+    docs_file.write_text("{% docs orders_status %}\nNew status\n{% enddocs %}\n")
+    stat = docs_file.stat()
+    os.utime(docs_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert dbml_docs.ParseDocsMarkdownFiles(docs_path) == {"orders_status": "New status"}
+    assert len(parsed) == 2
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+
+def test_docs_cache_unwritable(tmp_path, monkeypatch):
+    # A cache dir below a regular file can never be created
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(core, "_DOCS_CACHE_DIR", tmp_path / "file" / "cache")
+    docs_path = tmp_path / "docs"
+    docs_path.mkdir()
+    (docs_path / "docs.md").write_text("{% docs orders_status %}Status of the order{% enddocs %}")
+
+    dbml_docs = make_dbml_docs(tmp_path)
+    assert dbml_docs.ParseDocsMarkdownFiles(docs_path) == {"orders_status": "Status of the order"}
+
+
+def test_docs_cache_skips_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "_DOCS_CACHE_DIR", tmp_path / "cache")
+    docs_path = tmp_path / "docs"
+    docs_path.mkdir()
+    (docs_path / "docs.md").write_bytes(b"{% docs good %}ok{% enddocs %}{% docs bad %}\xff{% enddocs %}")
+
+    dbml_docs = make_dbml_docs(tmp_path)
+    assert dbml_docs.ParseDocsMarkdownFiles(docs_path) == {}
+    assert not (tmp_path / "cache").exists()
+
+
+def test_relationship_without_ref(tmp_path):
+    schema_path = tmp_path / "schema.yml"
+    schema_path.write_text(
+        "models:\n"
+        "  - name: orders\n"
+        "    columns:\n"
+        "      - name: customer_id\n"
+        "        tests:\n"
+        "          - relationships:\n"
+        "              to: customers\n"
+        "              field: customer_id\n"
+    )
+    dbml_docs = DbmlDocs(schema_path, TESTS_DIR / "catalog.json", tmp_path / "no_docs", tmp_path / "test.dbml")
+    with pytest.raises(ValueError, match=r"ORDERS\.CUSTOMER_ID has to: 'customers'"):
+        dbml_docs.GenerateDbml()
+
+
+def test_docs_markdown_whitespace_and_newlines(tmp_path):
+    docs_file = tmp_path / "docs.md"
+    docs_file.write_bytes(
+        "{% docs \xa0crlf\xa0 %}\xa0a\r\nb\rc\xa0{% enddocs %}".encode("utf-8")
+    )
+    dbml_docs = make_dbml_docs(tmp_path)
+    assert dbml_docs._ParseDocsMarkdownFile(docs_file) == {"crlf": "a\nb\nc"}
+
+
+def test_generate_dbml_matches_example(tmp_path):
+    make_dbml_docs(tmp_path).GenerateDbml()
+    assert (tmp_path / "test.dbml").read_text() == (TESTS_DIR / "example.dbml").read_text()
+
+
+@pytest.mark.parametrize("description, expected", [
+    ("Plain description", "Note: 'Plain description'"),
+    ("Customer's name", "Note: 'Customers name'"),
+    ('{{ doc("orders_status") }}', "Note: 'Status of the order'"),
+    ('\'{{ doc("orders_status") }}\'', "Note: 'Status of the order'"),
+    ('It\'s {{ doc("orders_status") }}, isn\'t it', "Note: 'Its Status of the order, isnt it'"),
+    ('{{ doc("unknown") }}', "Note: ''"),
+])
+def test_parse_description(tmp_path, description, expected):
+    dbml_docs = make_dbml_docs(tmp_path)
+    dbml_docs.docs_dict = {"orders_status": "Status of the order"}
+    assert dbml_docs.ParseDescription({"description": description}) == expected
+
+
+def test_parse_description_missing(tmp_path):
+    assert make_dbml_docs(tmp_path).ParseDescription({"name": "status"}) == ""
@@ -1,10 +1,63 @@
 from dbterd import cli
+import dbterd.terminal as terminal
+from dbterd.terminal import _catalog_is_fresh
 from click.testing import CliRunner
+from pathlib import Path
 import filecmp
+import os
+import pytest
+
+TESTS_DIR = Path(__file__).parent
 
 def test_cli():
     runner = CliRunner()
-    result = runner.invoke(cli, ["schema.yml", "catalog.json", "test.dbml", "testproject", "False"])
+    result = runner.invoke(cli, ["schema.yml", "catalog.json", "test.dbml", "docs", "testproject", "False"])
     assert result.exit_code == 0
     assert filecmp.cmp('example.dbml', 'test.dbml')
-    
\ No newline at end of file
+    
+
+def make_project(tmp_path):
+    models_path = tmp_path / "models"
+    (models_path / "staging").mkdir(parents=True)
+    model = models_path / "staging" / "orders.sql"
+    model.write_text("select 1")
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text("{}")
+    os.utime(model, (1, 1))
+    return models_path, model, catalog
+
+
+def test_catalog_is_fresh(tmp_path):
+    models_path, model, catalog = make_project(tmp_path)
+    assert _catalog_is_fresh(catalog, models_path)
+
+    # A model changed after the catalog was built
+    os.utime(model, (catalog.stat().st_mtime + 10, catalog.stat().st_mtime + 10))
+    assert not _catalog_is_fresh(catalog, models_path)
+
+
+def test_catalog_is_fresh_missing(tmp_path):
+    models_path, model, catalog = make_project(tmp_path)
+    assert not _catalog_is_fresh(catalog, tmp_path / "no_models")
+    assert not _catalog_is_fresh(tmp_path / "no_catalog.json", models_path)
+
+
+def test_catalog_is_fresh_dangling_symlink(tmp_path):
+    models_path, model, catalog = make_project(tmp_path)
+    (models_path / "staging" / "broken.sql").symlink_to(tmp_path / "nonexistent.sql")
+    assert not _catalog_is_fresh(catalog, models_path)
+
+
+@pytest.mark.parametrize("force", [False, True])
+def test_cli_force(tmp_path, monkeypatch, force):
+    models_path, model, catalog = make_project(tmp_path)
+    catalog.write_bytes((TESTS_DIR / "catalog.json").read_bytes())
+    os.utime(model, (1, 1))
+    commands = []
+    monkeypatch.setattr(terminal.subprocess, "run", lambda command, **kwargs: commands.append(command))
+
+    args = [str(TESTS_DIR / "schema.yml"), str(catalog), str(tmp_path / "test.dbml"), str(tmp_path / "docs"),
+            "testproject", "False", "--models-path", str(models_path)]
+    result = CliRunner().invoke(cli, args + ["--force"] if force else args)
+    assert result.exit_code == 0
+    assert ("dbt docs generate" in commands) == force